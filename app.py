@@ -1,45 +1,118 @@
 # app.py
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request
+from fastapi.responses import HTMLResponse, ORJSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.datastructures import Headers
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from typing import List, Dict, Optional
+from typing import List, Dict, Iterator, Optional
 import os
 from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 import io
+import gzip
+import re
+import json
+import orjson
+import asyncio
+import threading
+import multiprocessing
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import hashlib
+import time
 from datetime import datetime
+from functools import lru_cache
 import uvicorn
 
 # Document processing imports
 import PyPDF2
+import pdf_pages
 try:
     import docx
     DOCX_AVAILABLE = True
 except ImportError:
     DOCX_AVAILABLE = False
+try:
+    import docx2txt
+    DOCX2TXT_AVAILABLE = True
+except ImportError:
+    DOCX2TXT_AVAILABLE = False
+# docx2txt is faster on paragraph-only documents but flattens table rows, so it is opt-in
+USE_DOCX2TXT = os.getenv("USE_DOCX2TXT", "false").lower() == "true"
+
+# Brotli for the frontend page (optional; gzip is used without it)
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+# Semantic search imports (optional, see requirements-semantic.txt; retrieval falls back to TF-IDF without them)
+try:
+    from sentence_transformers import SentenceTransformer
+    import hnswlib
+    SEMANTIC_AVAILABLE = True
+except ImportError:
+    SEMANTIC_AVAILABLE = False
+
+# Token counting (optional; falls back to a ~4 chars/token estimate)
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
 
 # Azure OpenAI imports
 from openai import AzureOpenAI
 
 # Scikit-learn for document search
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.base import clone
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer, ENGLISH_STOP_WORDS
+from sklearn.pipeline import make_pipeline
 import numpy as np
+import joblib
+from scipy import sparse
 
 # ================== AZURE CONFIGURATION ==================
 AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
 AZURE_OPENAI_KEY = os.getenv("AZURE_OPENAI_KEY")
 AZURE_OPENAI_VERSION = os.getenv("AZURE_OPENAI_VERSION", "2025-04-01-preview")
 GPT5_DEPLOYMENT_NAME = os.getenv("GPT5_DEPLOYMENT_NAME", "gpt-5-chat")
+# Token budget for retrieved document context in each chat request
+MAX_CONTEXT_TOKENS = int(os.getenv("MAX_CONTEXT_TOKENS", 12000))
+# ========================================================
+
+# ================== CACHE CONFIGURATION ==================
+CACHE_DIR = os.getenv("CACHE_DIR", "./.cache")
+INDEX_CACHE_PATH = os.path.join(CACHE_DIR, "index.joblib")
+HNSW_INDEX_PATH = os.path.join(CACHE_DIR, "hnsw.bin")
+# Extracted text and chunks per uploaded file, keyed by content hash; emptied by clear_all
+EXTRACT_CACHE_DIR = os.path.join(CACHE_DIR, "extracted")
+# Bump whenever extraction, splitter or vectorizer parameters change
+CACHE_VERSION = 9
+# ========================================================
+
+# ================== INDEXING CONFIGURATION ==================
+# IDF weights are refit per upload until the corpus holds this many chunks; after that new chunks are
+# appended against the current weights, with a full refit once the corpus has grown by IDF_REFIT_GROWTH
+IDF_FREEZE_MIN_CHUNKS = int(os.getenv("IDF_FREEZE_MIN_CHUNKS", 200))
+IDF_REFIT_GROWTH = float(os.getenv("IDF_REFIT_GROWTH", 2.0))
+# ========================================================
+
+# ================== SEMANTIC SEARCH CONFIGURATION ==================
+SEMANTIC_SEARCH_ENABLED = os.getenv("SEMANTIC_SEARCH_ENABLED", "true").lower() == "true"
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
 # ========================================================
 
 app = FastAPI(
     title="ADR Chambers Legal AI Assistant",
     description="Professional legal document analysis powered by Azure AI",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # CORS (safe to allow all for demo/local)
@@ -51,6 +124,39 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def _accepted_encodings(header: str) -> set:
+    # Codings listed with q=0 are explicitly refused
+    accepted = set()
+    for part in header.split(','):
+        coding, *params = [p.strip() for p in part.split(';')]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding and q > 0:
+            accepted.add(coding.lower())
+    return accepted
+
+# Event-stream routes: compressing them would hold tokens in the compressor instead of flushing each event
+GZIP_EXCLUDED_PATHS = {"/api/chat"}
+
+class SelectiveGZipMiddleware(GZipMiddleware):
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and (
+            scope["path"] in GZIP_EXCLUDED_PATHS
+            or "gzip" not in _accepted_encodings(Headers(scope=scope).get("Accept-Encoding", ""))
+        ):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+# Compress JSON API responses; the chat stream and responses that set Content-Encoding themselves pass through
+app.add_middleware(SelectiveGZipMiddleware, minimum_size=1024)
+
 # Serve /static
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -58,11 +164,6 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 class ChatRequest(BaseModel):
     message: str
 
-class ChatResponse(BaseModel):
-    response: str
-    sources: List[str]
-    retrieved_chunks: int
-
 class DocumentUploadResponse(BaseModel):
     filename: str
     status: str
@@ -71,42 +172,289 @@ class DocumentUploadResponse(BaseModel):
     error: Optional[str] = None
 
 # --------------- Document logic ---------------
+# Loading the encoding may download its BPE file; a failure is retried after this many seconds
+TOKEN_ENCODING_RETRY_SECONDS = 300
+_encoding = None
+_encoding_retry_at = 0.0
+_encoding_lock = threading.Lock()
+
+def _token_encoding():
+    # gpt-4o's encoding is the closest published match for the GPT-5 deployment
+    global _encoding, _encoding_retry_at
+    if _encoding is not None or not TIKTOKEN_AVAILABLE:
+        return _encoding
+    # Callers never queue behind a slow download; they use the estimate until it lands
+    if time.monotonic() < _encoding_retry_at or not _encoding_lock.acquire(blocking=False):
+        return None
+    try:
+        if _encoding is None:
+            _encoding = tiktoken.encoding_for_model("gpt-4o")
+    except Exception:
+        _encoding_retry_at = time.monotonic() + TOKEN_ENCODING_RETRY_SECONDS
+    finally:
+        _encoding_lock.release()
+    return _encoding
+
+def count_tokens(text: str) -> int:
+    encoding = _token_encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode_ordinary(text))
+
 class Document:
-    def __init__(self, content: str, metadata: Dict):
+    # Slotted with flat fields: no per-chunk __dict__ or metadata dict on large libraries
+    __slots__ = ('content', 'filename', 'chunk_id', 'upload_ts', 'parent_id', '_n_tokens')
+    
+    def __init__(self, content: str, filename: str, chunk_id: int, upload_ts: float, parent_id: Optional[int] = None):
         self.content = content
-        self.metadata = metadata
+        self.filename = filename
+        self.chunk_id = chunk_id
+        self.upload_ts = upload_ts
+        # Index into DocumentProcessor.parents for retrieval-sized child chunks
+        self.parent_id = parent_id
+        self._n_tokens = None
+    
+    @property
+    def n_tokens(self) -> int:
+        # Counted once per chunk, then reused by every query that retrieves it; estimates aren't kept
+        if self._n_tokens is not None:
+            return self._n_tokens
+        n_tokens = count_tokens(self.content)
+        if _encoding is not None:
+            self._n_tokens = n_tokens
+        return n_tokens
+
+# PyPDF2 is pure Python and holds the GIL, so large PDFs are split across processes
+PDF_PARALLEL_MIN_PAGES = 16
+
+# One pool shared by every upload thread, so concurrent PDFs queue for workers instead of forking their own
+PDF_POOL_WORKERS = min(8, os.cpu_count() or 4)
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            # Workers start from a fresh interpreter rather than forking a multi-threaded server. The task
+            # function lives in pdf_pages so unpickling it imports PyPDF2, not this module and its stack
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload(['pdf_pages'])
+            else:
+                context = multiprocessing.get_context('spawn')
+            _pdf_pool = ProcessPoolExecutor(max_workers=PDF_POOL_WORKERS, mp_context=context)
+        return _pdf_pool
+
+def _discard_pdf_pool(broken: ProcessPoolExecutor):
+    # A killed worker (e.g. OOM on a large filing) breaks the whole pool; the next PDF starts a fresh one
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is broken:
+            _pdf_pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
 
 class TextSplitter:
-    def __init__(self, chunk_size: int = 1500, chunk_overlap: int = 300):
+    # Line-start markers of legal structure; a document only splits on the ones it actually uses
+    STRUCTURE_MARKERS = {
+        'article': r'(?:ARTICLE|Article)\s+[\dIVXLC]+',
+        'section': r'(?:SECTION|Section)\s+\d',
+        'clause': r'(?:CLAUSE|Clause)\s+\d',
+        'schedule': r'(?:SCHEDULE|Schedule)\s+[\dA-Z]',
+        'section_sign': r'§\s*\d',
+        'whereas': r'WHEREAS\b',
+        'numbered': r'\d+\.(?:\d+\.?)*[ \t]+[A-Z]',
+    }
+    
+    def __init__(self, chunk_size: int = 1500, chunk_overlap: int = 300, child_chunk_size: int = 400,
+                 structure_markers: Optional[Dict[str, str]] = None):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
-        self.separators = ["\n\nArticle ", "\n\nSection ", "\n\nClause ", "\n\n", "\n", ". ", " "]
+        self.child_chunk_size = child_chunk_size
+        self.min_chunk_size = 50
+        self.tiny_chunk_size = 100
+        # Roughly the first 8k tokens, used to decide which markers a document uses
+        self.structure_sample_chars = 32000
+        self.structure_markers = structure_markers if structure_markers is not None else self.STRUCTURE_MARKERS
+        self.separators = ["\n\n", "\n", ". ", " "]
+        self.child_separators = ["\n\n", "\n", ". ", "; ", " "]
+        self._structure_patterns: Dict[tuple, re.Pattern] = {}
+    
+    def _structure_pattern(self, text: str) -> Optional[re.Pattern]:
+        sample = text[:self.structure_sample_chars]
+        used = tuple(
+            name for name, marker in self.structure_markers.items()
+            if len(re.findall(rf"\n[ \t]*(?:{marker})", sample)) >= 2
+        )
+        if not used:
+            return None
+        if used not in self._structure_patterns:
+            alternation = "|".join(self.structure_markers[name] for name in used)
+            self._structure_patterns[used] = re.compile(rf"\n[ \t]*(?:{alternation})")
+        return self._structure_patterns[used]
     
     def split_text(self, text: str) -> List[str]:
-        chunks = []
-        for separator in self.separators:
-            if separator in text:
-                sections = text.split(separator)
-                current_chunk = ""
-                for i, section in enumerate(sections):
-                    section_text = (separator + section) if i > 0 else section
-                    if len(current_chunk) + len(section_text) <= self.chunk_size:
-                        current_chunk += section_text
-                    else:
-                        if current_chunk:
-                            chunks.append(current_chunk.strip())
-                        current_chunk = section_text
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                break
+        return self._split(text, self.chunk_size, self.chunk_overlap, self.separators, self._structure_pattern(text))
+    
+    def split_hierarchical(self, text: str) -> List[tuple]:
+        # Small sentence-aligned children are indexed; their parent chunk is what the LLM reads
+        overlap = self.chunk_overlap * self.child_chunk_size // self.chunk_size
+        return [
+            (parent, self._split(parent, self.child_chunk_size, overlap, self.child_separators) or [parent])
+            for parent in self.split_text(text)
+        ]
+    
+    def _split(self, text: str, chunk_size: int, chunk_overlap: int, separators: List[str],
+               structure: Optional[re.Pattern] = None) -> List[str]:
+        # Work on (start, end) offsets so the text is only sliced once per emitted chunk
+        boundaries = [m.start() for m in structure.finditer(text)] if structure else []
+        spans = []
+        for start, end in zip([0] + boundaries, boundaries + [len(text)]):
+            if end > start:
+                spans.extend(self._split_span(text, start, end, chunk_size, chunk_overlap, separators))
+        
+        # Tiny pieces (usually headings) lead the piece after them when it still fits
+        folded = []
+        carry = None
+        for start, end in spans:
+            if carry is not None:
+                if end - carry <= chunk_size:
+                    start = carry
+                else:
+                    folded.append((carry, start))
+                carry = None
+            if end - start < self.tiny_chunk_size:
+                carry = start
+            else:
+                folded.append((start, end))
+        if carry is not None:
+            folded.append((carry, len(text)))
+        
+        # Greedy merge of neighbours, then fold leftover tiny chunks into a neighbour
+        merged = []
+        for start, end in folded:
+            if merged and end - merged[-1][0] <= chunk_size:
+                merged[-1] = (merged[-1][0], end)
+            else:
+                merged.append((start, end))
+        i = 0
+        while i < len(merged) and len(merged) > 1:
+            start, end = merged[i]
+            if end - start < self.tiny_chunk_size:
+                # Prefer a neighbour it fits into, else the smaller one: a slightly oversized chunk
+                # beats dropping text (often a clause ending) that its parent still contains
+                prev_size = end - merged[i - 1][0] if i > 0 else None
+                next_size = merged[i + 1][1] - start if i + 1 < len(merged) else None
+                if next_size is None or (prev_size is not None and (prev_size <= chunk_size or prev_size <= next_size)):
+                    merged[i - 1] = (merged[i - 1][0], end)
+                else:
+                    merged[i + 1] = (start, merged[i + 1][1])
+                del merged[i]
+                continue
+            i += 1
         
-        if not chunks:
-            for i in range(0, len(text), self.chunk_size - self.chunk_overlap):
-                chunk = text[i:i + self.chunk_size]
-                if chunk.strip():
-                    chunks.append(chunk.strip())
+        chunks = []
+        for start, end in merged:
+            chunk = text[start:end].strip()
+            if len(chunk) > self.min_chunk_size:
+                chunks.append(chunk)
+        return chunks
+    
+    def _split_span(self, text: str, start: int, end: int, chunk_size: int, chunk_overlap: int,
+                    separators: List[str]) -> List[tuple]:
+        if end - start <= chunk_size:
+            return [(start, end)]
+        if not separators:
+            # No separator left to try: overlapping fixed windows
+            step = chunk_size - chunk_overlap
+            return [(s, min(s + chunk_size, end)) for s in range(start, end - chunk_overlap, step)]
         
-        return [c for c in chunks if len(c.strip()) > 50]
+        # Pack pieces up to the last separator that fits; only oversized pieces recurse on finer separators
+        separator, finer = separators[0], separators[1:]
+        spans = []
+        while end - start > chunk_size:
+            cut = text.rfind(separator, start + 1, min(start + chunk_size + len(separator), end))
+            if cut == -1:
+                cut = text.find(separator, start + chunk_size, end)
+                if cut == -1:
+                    cut = end
+                spans.extend(self._split_span(text, start, cut, chunk_size, chunk_overlap, finer))
+            else:
+                spans.append((start, cut))
+            start = cut
+        if end > start:
+            spans.append((start, end))
+        return spans
+
+class SemanticIndex:
+    # HNSW index over normalized sentence embeddings; item ids are positions in DocumentProcessor.documents
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._model = None
+        self.index = None
+        self._lock = threading.Lock()
+        self._encode_query = lru_cache(maxsize=512)(self._encode_query_uncached)
+    
+    @property
+    def model(self):
+        # Loaded on first use so startup doesn't wait on the model download
+        if self._model is None:
+            self._model = SentenceTransformer(self.model_name)
+        return self._model
+    
+    @property
+    def count(self) -> int:
+        return self.index.get_current_count() if self.index is not None else 0
+    
+    def _new_index(self, max_elements: int):
+        index = hnswlib.Index(space='cosine', dim=self.model.get_sentence_embedding_dimension())
+        index.init_index(max_elements=max_elements, ef_construction=200, M=16)
+        return index
+    
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts, batch_size=64, normalize_embeddings=True, convert_to_numpy=True).astype(np.float32, copy=False)
+    
+    def _encode_query_uncached(self, query: str) -> np.ndarray:
+        return self.encode([query])
+    
+    def add(self, texts: List[str]):
+        if not texts:
+            return
+        embeddings = self.encode(texts)
+        with self._lock:
+            if self.index is None:
+                self.index = self._new_index(max(1024, len(texts)))
+            offset = self.index.get_current_count()
+            needed = offset + len(texts)
+            if needed > self.index.get_max_elements():
+                self.index.resize_index(max(needed, 2 * self.index.get_max_elements()))
+            self.index.add_items(embeddings, ids=np.arange(offset, needed))
+    
+    def search(self, query: str, k: int) -> tuple:
+        query_embedding = self._encode_query(query)
+        with self._lock:
+            k = min(k, self.count)
+            self.index.set_ef(max(64, k))
+            labels, distances = self.index.knn_query(query_embedding, k=k)
+        return tuple(zip(labels[0].tolist(), (1.0 - distances[0]).tolist()))
+    
+    def reset(self):
+        with self._lock:
+            self.index = None
+    
+    def save(self, path: str):
+        with self._lock:
+            if self.index is not None:
+                self.index.save_index(path)
+    
+    def load(self, path: str, expected_count: int) -> bool:
+        index = hnswlib.Index(space='cosine', dim=self.model.get_sentence_embedding_dimension())
+        index.load_index(path, max_elements=max(1024, expected_count))
+        if index.get_current_count() != expected_count:
+            return False
+        with self._lock:
+            self.index = index
+        return True
 
 class AzureAIClient:
     def __init__(self):
@@ -130,11 +478,12 @@ class AzureAIClient:
             "Consult with ADR Chambers legal professionals for specific guidance.\""
         )
     
-    def generate_response(self, message: str, context: str = "") -> str:
+    def stream_response(self, message: str, context: str = "") -> Iterator[str]:
         if not self.client:
-            return ("⚠️ Azure is not configured. Set AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_KEY env vars to enable AI responses.\n\n"
-                    "This analysis is for informational purposes only and does not constitute legal advice. "
-                    "Consult with ADR Chambers legal professionals for specific guidance.")
+            yield ("⚠️ Azure is not configured. Set AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_KEY env vars to enable AI responses.\n\n"
+                   "This analysis is for informational purposes only and does not constitute legal advice. "
+                   "Consult with ADR Chambers legal professionals for specific guidance.")
+            return
         try:
             messages = [{"role": "system", "content": self.system_prompt}]
             if context:
@@ -143,53 +492,126 @@ class AzureAIClient:
                 messages.append({"role": "user", "content": message})
             
             # Simplified approach - just use the basic parameters that work with your model
-            response = self.client.chat.completions.create(
+            stream = self.client.chat.completions.create(
                 model=self.deployment_name,
                 messages=messages,
-                max_completion_tokens=4000
+                max_completion_tokens=4000,
+                stream=True
             )
-            return response.choices[0].message.content
+            for chunk in stream:
+                # Azure sends content-filter chunks with no choices
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
                     
         except Exception as e:
-            return f"⚠️ Azure AI Error: {str(e)}"
+            yield f"⚠️ Azure AI Error: {str(e)}"
+
+# Boilerplate that appears in nearly every legal chunk and only adds high-DF noise features
+LEGAL_STOP_WORDS = sorted(ENGLISH_STOP_WORDS | {
+    'hereby', 'herein', 'hereof', 'hereto', 'hereunder', 'thereof', 'therein', 'thereto',
+    'whereas', 'whereby', 'shall', 'party', 'parties', 'agreement',
+})
+# Compiled once and used as the tokenizer, instead of sklearn recompiling token_pattern on every fit
+TOKEN_RE = re.compile(r"(?u)\b[a-zA-Z][a-zA-Z]+\b")
+
+def _content_hash(text: str) -> bytes:
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
 
 class DocumentProcessor:
     def __init__(self):
         self.text_splitter = TextSplitter()
-        self.vectorizer = TfidfVectorizer(
-            max_features=5000, stop_words='english', ngram_range=(1, 3), max_df=0.85, min_df=2
+        # Hashed features have no vocabulary to go stale, so chunks appended between refits keep every
+        # term (terms unseen at fit time simply get the maximum IDF). Hashing has no max_features, min_df
+        # or max_df: rare terms and bigrams stay in, roughly doubling nnz per row against the old
+        # 5000-feature vocabulary, and ubiquitous terms are only damped by their low IDF
+        self.vectorizer = make_pipeline(
+            HashingVectorizer(
+                n_features=2 ** 18, stop_words=LEGAL_STOP_WORDS, ngram_range=(1, 2), alternate_sign=False,
+                norm=None, dtype=np.float32, tokenizer=TOKEN_RE.findall, token_pattern=None
+            ),
+            TfidfTransformer(sublinear_tf=True, norm='l2'),
         )
         self.documents: List[Document] = []
+        self.parents: List[Document] = []
+        # Content digests of everything indexed, so re-uploads and shared boilerplate are stored once
+        self._parent_hashes: set = set()
+        self._chunk_hashes: set = set()
+        # Maintained on upload/clear so the summary endpoint never scans every chunk
+        self._files: set = set()
         self.document_vectors = None
         self.is_fitted = False
+        # Corpus size at the last full IDF fit
+        self._fitted_chunks = 0
+        # Serializes corpus mutation; uploads are parsed and indexed off the event loop
+        self._lock = threading.Lock()
+        self.semantic = SemanticIndex(EMBEDDING_MODEL_NAME) if SEMANTIC_AVAILABLE and SEMANTIC_SEARCH_ENABLED else None
+        # Bumped on every corpus change so cached rankings never outlive the index;
+        # _idf_version only moves when the IDF weights themselves are refit
+        self._vec_version = 0
+        self._idf_version = 0
+        self._transform_query = lru_cache(maxsize=512)(self._transform_query_uncached)
+        self._rank = lru_cache(maxsize=512)(self._rank_uncached)
     
     def extract_text_from_pdf(self, file_content: bytes) -> str:
         try:
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content))
-            text = ""
-            for page in pdf_reader.pages:
-                page_text = page.extract_text() or ""
-                text += page_text + "\n"
-            return text.strip()
+            pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content), strict=False)
+            num_pages = len(pdf_reader.pages)
+            page_texts = None
+            if num_pages >= PDF_PARALLEL_MIN_PAGES and PDF_POOL_WORKERS >= 2:
+                page_texts = self._extract_pdf_pages_parallel(file_content, num_pages)
+            if page_texts is None:
+                page_texts = [page.extract_text() or "" for page in pdf_reader.pages]
+            return "\n".join(page_texts).strip()
         except Exception as e:
             raise Exception(f"PDF extraction failed: {str(e)}")
     
+    def _extract_pdf_pages_parallel(self, file_content: bytes, num_pages: int) -> Optional[List[str]]:
+        # Workers read one temp file rather than each page range pickling the whole PDF
+        fd, path = tempfile.mkstemp(suffix='.pdf')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(file_content)
+            step = -(-num_pages // PDF_POOL_WORKERS)
+            executor = _get_pdf_pool()
+            try:
+                futures = [
+                    executor.submit(pdf_pages.extract_pages, path, start, min(start + step, num_pages))
+                    for start in range(0, num_pages, step)
+                ]
+                return [text for future in futures for text in future.result()]
+            except BrokenProcessPool:
+                # Fall back to the serial path for this file
+                _discard_pdf_pool(executor)
+                return None
+        finally:
+            os.remove(path)
+    
     def extract_text_from_docx(self, file_content: bytes) -> str:
-        if not DOCX_AVAILABLE:
+        use_docx2txt = USE_DOCX2TXT and DOCX2TXT_AVAILABLE
+        if not DOCX_AVAILABLE and not use_docx2txt:
             raise Exception("python-docx not installed")
         try:
-            d = docx.Document(io.BytesIO(file_content))
-            paragraphs = [p.text.strip() for p in d.paragraphs if p.text.strip()]
-            tables_text = []
-            for table in d.tables:
-                for row in table.rows:
-                    row_text = [cell.text.strip() for cell in row.cells if cell.text.strip()]
-                    if row_text:
-                        tables_text.append(" | ".join(row_text))
-            combined = "\n".join(paragraphs + tables_text)
-            if not combined.strip():
+            parts = []
+            if use_docx2txt:
+                for line in docx2txt.process(io.BytesIO(file_content)).splitlines():
+                    line = line.strip()
+                    if line:
+                        parts.append(line)
+            else:
+                d = docx.Document(io.BytesIO(file_content))
+                # .text is rebuilt from runs on every access, so read it once per paragraph/cell
+                for p in d.paragraphs:
+                    text = p.text.strip()
+                    if text:
+                        parts.append(text)
+                for table in d.tables:
+                    for row in table.rows:
+                        row_text = " | ".join(text for text in (cell.text.strip() for cell in row.cells) if text)
+                        if row_text:
+                            parts.append(row_text)
+            if not parts:
                 raise Exception("No text content found in Word document")
-            return combined.strip()
+            return "\n".join(parts)
         except Exception as e:
             raise Exception(f"Word document extraction failed: {str(e)}")
     
@@ -201,63 +623,290 @@ class DocumentProcessor:
                 continue
         raise Exception("Could not decode text file")
     
-    def process_file(self, filename: str, file_content: bytes) -> Dict:
+    def _read_cache(self, cache_path: str) -> Optional[Dict]:
         try:
-            ext = os.path.splitext(filename)[1].lower()
-            if ext == '.pdf':
-                text_content = self.extract_text_from_pdf(file_content)
-            elif ext == '.docx':
-                text_content = self.extract_text_from_docx(file_content)
-            elif ext == '.txt':
-                text_content = self.extract_text_from_txt(file_content)
-            else:
-                return {'filename': filename, 'status': 'error', 'error': f'Unsupported file type: {ext}'}
-            
-            if not text_content.strip():
-                return {'filename': filename, 'status': 'error', 'error': 'No text content found in file'}
-            
-            chunks = self.text_splitter.split_text(text_content)
-            for i, chunk in enumerate(chunks):
-                self.documents.append(Document(
-                    content=chunk,
-                    metadata={'filename': filename, 'chunk_id': i, 'upload_date': datetime.now().isoformat()}
-                ))
-            
-            if self.documents:
-                texts = [d.content for d in self.documents]
-                self.document_vectors = self.vectorizer.fit_transform(texts)
-                self.is_fitted = True
-            
-            return {'filename': filename, 'status': 'success', 'chunks': len(chunks), 'content_length': len(text_content)}
+            with open(cache_path, encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return cached if cached.get('version') == CACHE_VERSION else None
+    
+    def _write_cache(self, cache_path: str, entry: Dict):
+        # Per-thread temp name: concurrent parses of identical bytes write the same entry
+        tmp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(EXTRACT_CACHE_DIR, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': CACHE_VERSION, **entry}, f)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass
+    
+    def _extract_chunks(self, filename: str, file_content: bytes):
+        ext = os.path.splitext(filename)[1].lower()
+        if ext not in ('.pdf', '.docx', '.txt'):
+            raise Exception(f'Unsupported file type: {ext}')
+        
+        # Identical bytes always parse to the same text, so skip extraction on a hit
+        digest = hashlib.sha256(file_content)
+        if ext == '.docx':
+            # The two Word extractors produce different text for the same file
+            digest.update(b'docx2txt' if USE_DOCX2TXT and DOCX2TXT_AVAILABLE else b'python-docx')
+        cache_path = os.path.join(EXTRACT_CACHE_DIR, f"{digest.hexdigest()}.json")
+        cached = self._read_cache(cache_path)
+        if cached is not None:
+            return cached['text'], cached['chunks']
+        
+        if ext == '.pdf':
+            text_content = self.extract_text_from_pdf(file_content)
+        elif ext == '.docx':
+            text_content = self.extract_text_from_docx(file_content)
+        else:
+            text_content = self.extract_text_from_txt(file_content)
+        
+        if not text_content.strip():
+            raise Exception('No text content found in file')
+        
+        chunks = self.text_splitter.split_hierarchical(text_content)
+        self._write_cache(cache_path, {'text': text_content, 'chunks': chunks})
+        return text_content, chunks
+    
+    def _refit(self, documents: List[Document]):
+        if (self.is_fitted and len(self.documents) >= IDF_FREEZE_MIN_CHUNKS
+                and len(documents) < IDF_REFIT_GROWTH * self._fitted_chunks):
+            # IDF is held between geometric refits, so only the appended chunks are vectorized
+            new_texts = [d.content for d in documents[len(self.documents):]]
+            new_vectors = self.vectorizer.transform(new_texts).astype(np.float32, copy=False)
+            document_vectors = sparse.vstack([self.document_vectors, new_vectors], format='csr')
+            self.documents, self.document_vectors = documents, document_vectors
+            return
+        
+        # One fit over the whole corpus per batch rather than per file
+        texts = [d.content for d in documents]
+        # Fit a fresh copy so concurrent searches keep consistent IDF weights until the swap
+        vectorizer = clone(self.vectorizer)
+        # float32 halves the bytes streamed through the similarity matmul; the vectorizer already emits it, so no copy
+        document_vectors = vectorizer.fit_transform(texts).astype(np.float32, copy=False).tocsr()
+        self.vectorizer, self.documents, self.document_vectors = vectorizer, documents, document_vectors
+        self.is_fitted = True
+        self._fitted_chunks = len(documents)
+        self._idf_version += 1
+    
+    def _sync_semantic(self):
+        # Embed whatever the semantic index is missing; rebuild if it ever runs ahead of the corpus
+        if self.semantic is None:
+            return
+        try:
+            if self.semantic.count > len(self.documents):
+                self.semantic.reset()
+            self.semantic.add([d.content for d in self.documents[self.semantic.count:]])
+        except Exception as e:
+            print(f"⚠️ Semantic indexing failed, using TF-IDF only: {str(e)}")
+    
+    def parse_file(self, filename: str, file_content: bytes) -> Dict:
+        # Touches no shared state, so uploads can be parsed concurrently in worker threads
+        try:
+            text_content, chunks = self._extract_chunks(filename, file_content)
+            num_children = sum(len(children) for _, children in chunks)
+            return {'filename': filename, 'status': 'success', 'chunks': num_children, 'content_length': len(text_content), 'chunk_texts': chunks}
         except Exception as e:
             return {'filename': filename, 'status': 'error', 'error': str(e)}
     
+    def add_parsed(self, parsed: List[Dict]) -> List[Dict]:
+        results = []
+        with self._lock:
+            documents = list(self.documents)
+            previous_parents = self.parents
+            parents = list(previous_parents)
+            new_parent_hashes = set()
+            new_chunk_hashes = set()
+            new_files = set()
+            upload_ts = datetime.now().timestamp()
+            for result in parsed:
+                added = 0
+                for i, (parent, children) in enumerate(result.pop('chunk_texts', [])):
+                    parent_hash = _content_hash(parent)
+                    if parent_hash in self._parent_hashes or parent_hash in new_parent_hashes:
+                        continue
+                    child_hashes = []
+                    for child in children:
+                        child_hash = _content_hash(child)
+                        if child_hash not in self._chunk_hashes and child_hash not in new_chunk_hashes:
+                            new_chunk_hashes.add(child_hash)
+                            child_hashes.append((child, child_hash))
+                    if not child_hashes:
+                        continue
+                    new_parent_hashes.add(parent_hash)
+                    filename = result['filename']
+                    parents.append(Document(content=parent, filename=filename, chunk_id=i, upload_ts=upload_ts))
+                    for child, _ in child_hashes:
+                        documents.append(Document(
+                            content=child, filename=filename, chunk_id=i, upload_ts=upload_ts, parent_id=len(parents) - 1
+                        ))
+                    added += len(child_hashes)
+                if result['status'] == 'success':
+                    result['chunks'] = added
+                if added:
+                    new_files.add(result['filename'])
+                results.append(result)
+            
+            # No-op, failed or all-duplicate batches leave the fitted index untouched
+            if len(documents) > len(self.documents):
+                try:
+                    # Parents are published first so any child a search can see already resolves
+                    self.parents = parents
+                    self._refit(documents)
+                except Exception as e:
+                    self.parents = previous_parents
+                    for result in results:
+                        if result['status'] == 'success':
+                            result.update(status='error', error=str(e))
+                else:
+                    self._parent_hashes |= new_parent_hashes
+                    self._chunk_hashes |= new_chunk_hashes
+                    self._files |= new_files
+                    self._sync_semantic()
+                    self._vec_version += 1
+                    if any(r['status'] == 'success' for r in results):
+                        self.save_index()
+        return results
+    
+    def process_files(self, files: List[tuple]) -> List[Dict]:
+        return self.add_parsed([self.parse_file(filename, file_content) for filename, file_content in files])
+    
+    def process_file(self, filename: str, file_content: bytes) -> Dict:
+        return self.process_files([(filename, file_content)])[0]
+    
+    def _transform_query_uncached(self, idf_version: int, query: str):
+        return self.vectorizer.transform([query]).astype(np.float32, copy=False).tocsr()
+    
+    def _rank_uncached(self, vec_version: int, query: str, k: int) -> tuple:
+        # Prefer ANN over embeddings when every chunk is embedded; otherwise fall back to TF-IDF
+        if self.semantic is not None and self.semantic.count == len(self.documents):
+            try:
+                return self.semantic.search(query, k)
+            except Exception:
+                pass
+        qv = self._transform_query(self._idf_version, query)
+        # TF-IDF rows are L2-normalized, so the sparse dot product is already the cosine
+        sims = (self.document_vectors @ qv.T).toarray().ravel()
+        if len(sims) > k:
+            idx = np.argpartition(-sims, k)[:k]
+            top = idx[np.argsort(-sims[idx])]
+        else:
+            top = np.argsort(-sims)
+        relevant = top[sims[top] > 0.001]
+        if not len(relevant):
+            relevant = top[:3]
+        return tuple(zip(relevant.tolist(), sims[relevant].tolist()))
+    
     def search_documents(self, query: str, k: int = 15) -> List[tuple]:
         if not self.is_fitted or not self.documents:
             return []
         try:
-            qv = self.vectorizer.transform([query])
-            sims = cosine_similarity(qv, self.document_vectors).flatten()
-            top = sims.argsort()[-k:][::-1]
-            results = []
-            for idx in top:
-                if sims[idx] > 0.001:
-                    results.append((self.documents[idx], sims[idx]))
-            if not results and self.documents:
-                for idx in top[:3]:
-                    results.append((self.documents[idx], sims[idx]))
-            return results
+            return [(self.documents[idx], score) for idx, score in self._rank(self._vec_version, query, k)]
         except Exception:
             return []
     
+    def expand_to_parents(self, results: List[tuple], max_parents: int = 8) -> List[tuple]:
+        # Each distinct parent once, ranked by its best-scoring child
+        sections = []
+        seen = set()
+        for doc, score in results:
+            if doc.parent_id in seen:
+                continue
+            seen.add(doc.parent_id)
+            sections.append((self.parents[doc.parent_id], score))
+            if len(sections) >= max_parents:
+                break
+        return sections
+    
     def get_summary(self) -> Dict:
-        unique_files = list({d.metadata.get('filename', 'Unknown') for d in self.documents})
-        return {'total_chunks': len(self.documents), 'unique_files': unique_files}
+        return {'total_chunks': len(self.documents), 'unique_files': list(self._files)}
+    
+    def save_index(self):
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            tmp_path = INDEX_CACHE_PATH + ".tmp"
+            joblib.dump({
+                'version': CACHE_VERSION,
+                'vectorizer': self.vectorizer,
+                'documents': self.documents,
+                'parents': self.parents,
+                'document_vectors': self.document_vectors,
+                'is_fitted': self.is_fitted,
+                'fitted_chunks': self._fitted_chunks,
+                'embedding_model': self.semantic.model_name if self.semantic else None,
+            }, tmp_path)
+            os.replace(tmp_path, INDEX_CACHE_PATH)
+            if self.semantic is not None and self.semantic.count:
+                self.semantic.save(HNSW_INDEX_PATH + ".tmp")
+                os.replace(HNSW_INDEX_PATH + ".tmp", HNSW_INDEX_PATH)
+        except Exception as e:
+            print(f"⚠️ Could not persist document index: {str(e)}")
+    
+    def load_index(self):
+        if not os.path.exists(INDEX_CACHE_PATH):
+            return
+        try:
+            state = joblib.load(INDEX_CACHE_PATH)
+        except Exception as e:
+            print(f"⚠️ Could not load document index: {str(e)}")
+            return
+        if state.get('version') != CACHE_VERSION:
+            return
+        with self._lock:
+            self.vectorizer = state['vectorizer']
+            self.documents = state['documents']
+            self.parents = state['parents']
+            self._parent_hashes = {_content_hash(d.content) for d in self.parents}
+            self._chunk_hashes = {_content_hash(d.content) for d in self.documents}
+            self._files = {d.filename for d in self.parents}
+            self.document_vectors = state['document_vectors']
+            self.is_fitted = state['is_fitted']
+            self._fitted_chunks = state['fitted_chunks']
+            self._idf_version += 1
+            if self.semantic is not None and self.documents:
+                loaded = False
+                if state.get('embedding_model') == self.semantic.model_name and os.path.exists(HNSW_INDEX_PATH):
+                    try:
+                        loaded = self.semantic.load(HNSW_INDEX_PATH, len(self.documents))
+                    except Exception as e:
+                        print(f"⚠️ Could not load semantic index: {str(e)}")
+                if not loaded:
+                    self.semantic.reset()
+                    self._sync_semantic()
+            self._vec_version += 1
     
     def clear_all(self):
-        self.documents = []
-        self.document_vectors = None
-        self.is_fitted = False
+        with self._lock:
+            self.documents = []
+            self.parents = []
+            self._parent_hashes = set()
+            self._chunk_hashes = set()
+            self._files = set()
+            self.document_vectors = None
+            self.is_fitted = False
+            self._fitted_chunks = 0
+            if self.semantic is not None:
+                self.semantic.reset()
+            self._vec_version += 1
+            self._idf_version += 1
+            for path in (INDEX_CACHE_PATH, HNSW_INDEX_PATH):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            # Cached extractions hold the full text of every uploaded document
+            try:
+                entries = list(os.scandir(EXTRACT_CACHE_DIR))
+            except FileNotFoundError:
+                entries = []
+            for entry in entries:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
 
 # Global instances
 ai_client = AzureAIClient()
@@ -402,62 +1051,126 @@ body{font-family:Segoe UI,Tahoma,Geneva,Verdana,sans-serif;background:#f8f9fa;co
 </html>
 """
 
+# The page never changes, so encode and compress it once at import
+_HTML_BYTES = HTML_TEMPLATE.encode('utf-8')
+_HTML_ENCODED = {'gzip': gzip.compress(_HTML_BYTES, compresslevel=9)}
+if BROTLI_AVAILABLE:
+    _HTML_ENCODED['br'] = brotli.compress(_HTML_BYTES, quality=11)
+
 # ---------------- Routes ----------------
+@app.on_event("startup")
+async def load_persisted_index():
+    doc_processor.load_index()
+    # Warm the token encoding in the background so a slow or blocked download never holds up requests
+    threading.Thread(target=_token_encoding, daemon=True).start()
+
 @app.get("/", response_class=HTMLResponse)
-async def serve_frontend():
-    return HTMLResponse(content=HTML_TEMPLATE)
+async def serve_frontend(request: Request):
+    accepted = _accepted_encodings(request.headers.get('accept-encoding', ''))
+    headers = {'Vary': 'Accept-Encoding'}
+    for encoding in ('br', 'gzip'):
+        if encoding in accepted and encoding in _HTML_ENCODED:
+            headers['Content-Encoding'] = encoding
+            return Response(content=_HTML_ENCODED[encoding], media_type='text/html', headers=headers)
+    return Response(content=_HTML_BYTES, media_type='text/html', headers=headers)
 
 @app.get("/api/health")
 async def health_check():
     azure_configured = bool(AZURE_OPENAI_KEY)
-    return {"status": "healthy", "azure_configured": azure_configured, "documents_loaded": len(doc_processor.documents)}
+    return {
+        "status": "healthy",
+        "azure_configured": azure_configured,
+        "semantic_search": doc_processor.semantic is not None,
+        "documents_loaded": len(doc_processor.documents),
+    }
 
 @app.post("/api/upload", response_model=List[DocumentUploadResponse])
 async def upload_documents(files: List[UploadFile] = File(...)):
-    results = []
-    for file in files:
+    # One result per uploaded file, in upload order (filenames may repeat, so position is the only match)
+    results = [None] * len(files)
+    accepted = []
+    for i, file in enumerate(files):
         if file.content_type not in [
             'application/pdf',
             'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
             'text/plain'
         ]:
-            results.append(DocumentUploadResponse(filename=file.filename, status="error", error="Unsupported file type"))
+            results[i] = DocumentUploadResponse(filename=file.filename, status="error", error="Unsupported file type")
             continue
-        try:
-            content = await file.read()
-            result = doc_processor.process_file(file.filename, content)
-            results.append(DocumentUploadResponse(
-                filename=result['filename'],
-                status=result['status'],
-                chunks=result.get('chunks'),
-                content_length=result.get('content_length'),
-                error=result.get('error')
-            ))
-        except Exception as e:
-            results.append(DocumentUploadResponse(filename=file.filename, status="error", error=str(e)))
+        accepted.append((i, file))
+
+    contents = await asyncio.gather(*(file.read() for _, file in accepted), return_exceptions=True)
+    to_parse = []
+    for (i, file), content in zip(accepted, contents):
+        if isinstance(content, Exception):
+            results[i] = DocumentUploadResponse(filename=file.filename, status="error", error=str(content))
+        else:
+            to_parse.append((i, file.filename, content))
+
+    # Parse files concurrently off the event loop, then vectorize them all in a single fit
+    parsed = await asyncio.gather(*(asyncio.to_thread(doc_processor.parse_file, name, content) for _, name, content in to_parse))
+    added = await asyncio.to_thread(doc_processor.add_parsed, parsed)
+    for (i, _, _), result in zip(to_parse, added):
+        results[i] = DocumentUploadResponse(
+            filename=result['filename'],
+            status=result['status'],
+            chunks=result.get('chunks'),
+            content_length=result.get('content_length'),
+            error=result.get('error')
+        )
     return results
 
-@app.post("/api/chat", response_model=ChatResponse)
+def _sse_event(payload: Dict) -> bytes:
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
+
+def _stream_chat(tokens: Iterator[str], sources: List[str], retrieved_chunks: int) -> Iterator[bytes]:
+    # Sources go first so the UI can label the answer before the first token arrives
+    yield _sse_event({"type": "sources", "sources": sources, "retrieved_chunks": retrieved_chunks})
+    for token in tokens:
+        yield _sse_event({"type": "token", "content": token})
+    yield _sse_event({"type": "done"})
+
+def _chat_stream_response(events: Iterator[bytes]) -> StreamingResponse:
+    return StreamingResponse(events, media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+def _build_context(message: str) -> Optional[tuple]:
+    # As many ~chunk_size/4-token parent sections as fit the budget; children are over-fetched
+    # because several usually share a parent
+    max_parents = max(1, MAX_CONTEXT_TOKENS * 4 // doc_processor.text_splitter.chunk_size)
+    search_results = doc_processor.search_documents(message, k=3 * max_parents)
+    if not search_results:
+        return None
+
+    # Retrieval ranks small child chunks; the model gets their full parent sections
+    sections = doc_processor.expand_to_parents(search_results, max_parents=max_parents)
+    # Fill the token budget best-first so any dropped sections are the least relevant ones
+    context_parts = []
+    sources = set()
+    used_tokens = 0
+    for doc, score in sorted(sections, key=lambda section: section[1], reverse=True):
+        n_tokens = doc.n_tokens
+        if used_tokens + n_tokens > MAX_CONTEXT_TOKENS:
+            continue
+        used_tokens += n_tokens
+        filename = doc.filename
+        sources.add(filename)
+        context_parts.append(f"--- DOCUMENT SECTION {len(context_parts)+1}: {filename} ---\n{doc.content}\n")
+    return "\n".join(context_parts), list(sources), len(context_parts)
+
+@app.post("/api/chat")
 async def chat_with_documents(request: ChatRequest):
     if len(doc_processor.documents) == 0:
-        return ChatResponse(response="Please upload legal documents first to begin analysis.", sources=[], retrieved_chunks=0)
+        return _chat_stream_response(_stream_chat(iter(["Please upload legal documents first to begin analysis."]), [], 0))
     try:
-        search_results = doc_processor.search_documents(request.message, k=15)
-        if not search_results:
-            return ChatResponse(response="No relevant content found for your query. Try rephrasing or upload more documents.", sources=[], retrieved_chunks=0)
-
-        context_parts = []
-        sources = set()
-        for i, (doc, score) in enumerate(search_results):
-            filename = doc.metadata.get('filename', 'Unknown')
-            sources.add(filename)
-            context_parts.append(f"--- DOCUMENT SECTION {i+1}: {filename} ---\n{doc.content}\n")
-        full_context = "\n".join(context_parts)
-        if len(full_context) > 25000:
-            full_context = full_context[:25000] + "\n\n[Additional content truncated...]"
-
-        ai_response = ai_client.generate_response(request.message, full_context)
-        return ChatResponse(response=ai_response, sources=list(sources), retrieved_chunks=len(search_results))
+        # Query embedding, ranking and token counting are CPU-bound, so they run off the event loop
+        built = await asyncio.to_thread(_build_context, request.message)
+        if built is None:
+            return _chat_stream_response(_stream_chat(iter(["No relevant content found for your query. Try rephrasing or upload more documents."]), [], 0))
+        full_context, sources, num_sections = built
+
+        # The sync generator is iterated in Starlette's threadpool, so the event loop stays free
+        tokens = ai_client.stream_response(request.message, full_context)
+        return _chat_stream_response(_stream_chat(tokens, sources, num_sections))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
 
@@ -467,7 +1180,8 @@ async def get_document_summary():
 
 @app.delete("/api/documents")
 async def clear_documents():
-    doc_processor.clear_all()
+    # clear_all waits on the corpus lock an in-flight upload holds through refit and save
+    await asyncio.to_thread(doc_processor.clear_all)
     return {"message": "All documents cleared successfully"}
 
 if __name__ == "__main__":
@@ -0,0 +1,10 @@
+# pdf_pages.py
+# Runs in PDF worker processes, so it imports only what page extraction needs
+from typing import List
+
+import PyPDF2
+
+def extract_pages(path: str, start: int, stop: int) -> List[str]:
+    with open(path, 'rb') as f:
+        pdf_reader = PyPDF2.PdfReader(f, strict=False)
+        return [pdf_reader.pages[i].extract_text() or "" for i in range(start, stop)]
@@ -63,16 +63,48 @@
       contentDiv.innerHTML = (content || "").replace(/\n/g, "<br>");
     }
 
+    appendSources(contentDiv, sources, chunks);
+
+    messageDiv.appendChild(contentDiv);
+    messagesContainer.appendChild(messageDiv);
+    messagesContainer.scrollTop = messagesContainer.scrollHeight;
+    return contentDiv;
+  }
+
+  function appendSources(contentDiv, sources, chunks) {
     if (sources && sources.length > 0) {
       const sourcesDiv = document.createElement("div");
       sourcesDiv.className = "message-sources";
       sourcesDiv.textContent = "Sources: " + sources.join(", ") + " - Retrieved " + chunks + " sections";
       contentDiv.appendChild(sourcesDiv);
     }
+  }
 
-    messageDiv.appendChild(contentDiv);
-    messagesContainer.appendChild(messageDiv);
-    messagesContainer.scrollTop = messagesContainer.scrollHeight;
+  function removeLoadingMessage() {
+    const messages = document.getElementById("messagesContainer");
+    const last = messages.lastElementChild;
+    if (last && last.querySelector(".loading")) messages.removeChild(last);
+  }
+
+  // Reads a text/event-stream body and calls onEvent with each "data:" JSON payload
+  async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+      const result = await reader.read();
+      if (result.done) break;
+      buffer += decoder.decode(result.value, { stream: true });
+      let boundary = buffer.indexOf("\n\n");
+      while (boundary !== -1) {
+        const block = buffer.substring(0, boundary);
+        buffer = buffer.substring(boundary + 2);
+        block.split("\n").forEach(line => {
+          if (line.indexOf("data: ") === 0) onEvent(JSON.parse(line.substring(6)));
+        });
+        boundary = buffer.indexOf("\n\n");
+      }
+    }
   }
 
   function setLoading(loading) {
@@ -130,19 +162,38 @@
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ message: text })
       });
-      const data = await response.json();
+      if (!response.ok || !response.body) throw new Error("Chat request failed: " + response.status);
 
-      // Remove loading bubble
+      // Render tokens as they stream in; sources arrive first and are shown once the answer ends
       const messages = document.getElementById("messagesContainer");
-      const last = messages.lastElementChild;
-      if (last && last.querySelector(".loading")) messages.removeChild(last);
+      let answer = "";
+      let sources = [];
+      let chunks = 0;
+      let contentDiv = null;
+      await readEventStream(response, function (event) {
+        if (event.type === "sources") {
+          sources = event.sources;
+          chunks = event.retrieved_chunks;
+        } else if (event.type === "token") {
+          if (!contentDiv) {
+            removeLoadingMessage();
+            contentDiv = addMessage("assistant", "");
+          }
+          answer += event.content;
+          contentDiv.innerHTML = formatMarkdown(answer);
+          messages.scrollTop = messages.scrollHeight;
+        }
+      });
 
-      addMessage("assistant", data.response, false, data.sources, data.retrieved_chunks);
+      if (!contentDiv) {
+        removeLoadingMessage();
+        contentDiv = addMessage("assistant", answer);
+      }
+      appendSources(contentDiv, sources, chunks);
+      messages.scrollTop = messages.scrollHeight;
     } catch (err) {
       console.error("Chat error:", err);
-      const messages = document.getElementById("messagesContainer");
-      const last = messages.lastElementChild;
-      if (last && last.querySelector(".loading")) messages.removeChild(last);
+      removeLoadingMessage();
       addMessage("assistant", "Sorry, I encountered an error. Please try again.");
     } finally {
       setLoading(false);